@@ -10,9 +10,18 @@ import os
 import sqlite3
 
 
+# journal_mode is stored in the database file; everything else here only lasts
+# for the connection, so connect() applies it rather than init_db().
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
 SCHEMA_SQL = r"""
 PRAGMA journal_mode=WAL;
-PRAGMA synchronous=NORMAL;
 
 CREATE TABLE IF NOT EXISTS meta_kv (
   k TEXT PRIMARY KEY,
@@ -61,6 +70,8 @@ CREATE TABLE IF NOT EXISTS wifi_client_sightings (
 );
 CREATE INDEX IF NOT EXISTS idx_wifi_client_mac_ts ON wifi_client_sightings (client_mac, ts);
 CREATE INDEX IF NOT EXISTS idx_wifi_client_ssid_ts ON wifi_client_sightings (ssid, ts);
+-- Dashboard queries match on lower(client_mac), which cannot use the plain column index.
+CREATE INDEX IF NOT EXISTS idx_wifi_client_lower_mac_ts ON wifi_client_sightings (lower(client_mac), ts);
 
 CREATE TABLE IF NOT EXISTS bt_sightings (
   ts INTEGER NOT NULL,
@@ -111,10 +122,12 @@ CREATE TABLE IF NOT EXISTS eventbus_events (
   bssid TEXT,
   raw_bytes INTEGER,
   gzip_bytes INTEGER,
-  payload_json TEXT NOT NULL
+  payload_json TEXT NOT NULL,
+  payload_bytes INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_eventbus_topic_ts ON eventbus_events (topic, ts);
 CREATE INDEX IF NOT EXISTS idx_eventbus_mac_ts ON eventbus_events (mac, ts);
+CREATE INDEX IF NOT EXISTS idx_eventbus_ts ON eventbus_events (ts);
 
 CREATE TABLE IF NOT EXISTS device_fingerprints (
   device_mac TEXT PRIMARY KEY,
@@ -153,9 +166,19 @@ def connect(db_path: str) -> sqlite3.Connection:
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     con = sqlite3.connect(db_path)
     con.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        con.execute(pragma)
     return con
 
 
+def _add_missing_columns(con: sqlite3.Connection) -> None:
+    # CREATE TABLE IF NOT EXISTS leaves tables from older schemas untouched.
+    cols = {r[1] for r in con.execute("PRAGMA table_info(eventbus_events)")}
+    if "payload_bytes" not in cols:
+        con.execute("ALTER TABLE eventbus_events ADD COLUMN payload_bytes INTEGER")
+
+
 def init_db(con: sqlite3.Connection) -> None:
     con.executescript(SCHEMA_SQL)
+    _add_missing_columns(con)
     con.commit()
@@ -3,7 +3,8 @@
 
 Connects to Kismet /eventbus/events.ws and subscribes to selected topics.
 Persists:
-- raw gzipped event records under $HOMESIGSEC_WORKDIR/raw-eventbus/YYYY-MM-DD/events.json.gz
+- raw gzipped event records under $HOMESIGSEC_WORKDIR/raw-eventbus/YYYY-MM-DD/events.<start_ts>.json.gz
+  (one segment per process start and day)
 - normalized event rows in sqlite ($HOMESIGSEC_WORKDIR/state/homesigsec.sqlite)
 
 No secrets in repo. Auth comes from env:
@@ -14,28 +15,73 @@ No secrets in repo. Auth comes from env:
 from __future__ import annotations
 
 import asyncio
+import atexit
 import datetime as dt
+import functools
 import gzip
+import io
 import json
 import os
+import signal
 import sqlite3
 import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
+import orjson
 import websockets
 
+try:
+    # ISA-L deflate is a drop-in GzipFile subclass and several times faster than zlib.
+    from isal.igzip import IGzipFile as _GzipFile
+except ImportError:
+    from gzip import GzipFile as _GzipFile
+
 import db as dbm
 
 
+# iso_now()/day_local() run several times per event; both only change once a
+# second, so the formatted strings are recomputed only when the epoch second ticks.
+_clock_ts = -1
+_clock_iso = ""
+_clock_day = ""
+
+
+@functools.lru_cache(maxsize=8)
+def _format_second(t: int) -> tuple[str, bytes, str]:
+    """Return (iso, iso as bytes, local day) for an epoch second."""
+    now = dt.datetime.fromtimestamp(t, dt.timezone.utc).astimezone()
+    iso = now.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return iso, iso.encode("ascii"), now.strftime("%Y-%m-%d")
+
+
+def _tick() -> None:
+    global _clock_ts, _clock_iso, _clock_day
+    t = int(time.time())
+    if t != _clock_ts:
+        _clock_iso, _, _clock_day = _format_second(t)
+        _clock_ts = t
+
+
 def iso_now() -> str:
-    return dt.datetime.now(dt.timezone.utc).astimezone().strftime("%Y-%m-%dT%H:%M:%S%z")
+    _tick()
+    return _clock_iso
 
 
 def day_local() -> str:
-    return dt.datetime.now().astimezone().strftime("%Y-%m-%d")
+    _tick()
+    return _clock_day
+
+
+_ws_url: str | None = None
 
 
 def build_ws_url() -> str:
+    """Return the eventbus websocket URL; env is read once per process."""
+    global _ws_url
+    if _ws_url is not None:
+        return _ws_url
+
     kismet_url = (os.environ.get("KISMET_URL") or "").strip().rstrip("/")
     if not kismet_url:
         raise RuntimeError("KISMET_URL missing")
@@ -47,20 +93,16 @@ def build_ws_url() -> str:
     else:
         ws_base = "ws://" + kismet_url
 
-    params = {}
     token = (os.environ.get("KISMET_API_TOKEN") or "").strip()
     user = (os.environ.get("KISMET_USER") or "").strip()
     pw = (os.environ.get("KISMET_PASS") or "").strip()
 
+    url = ws_base + "/eventbus/events.ws"
     if token:
-        params["KISMET"] = token
+        url += "?KISMET=" + urllib.parse.quote_plus(token)
     elif user and pw:
-        params["user"] = user
-        params["password"] = pw
-
-    url = ws_base + "/eventbus/events.ws"
-    if params:
-        url += "?" + urllib.parse.urlencode(params)
+        url += "?user=" + urllib.parse.quote_plus(user) + "&password=" + urllib.parse.quote_plus(pw)
+    _ws_url = url
     return url
 
 
@@ -76,56 +118,93 @@ def db_path() -> str:
     return os.path.join(workdir(), "state", "homesigsec.sqlite")
 
 
+# Raw segments are named after the process start so a restart never appends
+# to a file whose last gzip member may have been left unterminated by a kill.
+_START_TS = int(time.time())
+
+
 def raw_path() -> str:
-    return os.path.join(workdir(), "raw-eventbus", day_local(), "events.json.gz")
+    """Return a fresh segment path for today; never an existing file."""
+    d = os.path.join(workdir(), "raw-eventbus", day_local())
+    path = os.path.join(d, f"events.{_START_TS}.json.gz")
+    n = 0
+    while os.path.exists(path):  # restarted within the same second
+        n += 1
+        path = os.path.join(d, f"events.{_START_TS}-{n}.json.gz")
+    return path
 
 
 def _lower_mac(x) -> str:
+    # strip() returns the same object when there is nothing to trim, so it is
+    # kept for safety; only the str() round-trip is skipped for str input.
+    if type(x) is str:
+        return x.strip().lower()
     return str(x).strip().lower()
 
 
+# Kismet eventbus often emits dicts keyed by topic names for subscribed topics.
+# For example: {"DOT11_PROBED_SSID": {...}, "DOT11_NEW_SSID_BASEDEV": {...}}
+# Order is priority when a message carries more than one known topic.
+_KNOWN_TOPICS = (
+    "DOT11_PROBED_SSID",
+    "DOT11_ADVERTISED_SSID",
+    "DOT11_RESPONSE_SSID",
+    "DOT11_WPA_HANDSHAKE",
+    "ALERT",
+    "MESSAGE",
+)
+_KNOWN_TOPICS_SET = frozenset(_KNOWN_TOPICS)
+
+
 def detect_topic(msg: dict) -> str:
-    # Kismet eventbus often emits dicts keyed by topic names for subscribed topics.
-    # For example: {"DOT11_PROBED_SSID": {...}, "DOT11_NEW_SSID_BASEDEV": {...}}
-    known = [
-        "DOT11_PROBED_SSID",
-        "DOT11_ADVERTISED_SSID",
-        "DOT11_RESPONSE_SSID",
-        "DOT11_WPA_HANDSHAKE",
-        "ALERT",
-        "MESSAGE",
-    ]
-    for k in known:
-        if k in msg:
-            return k
+    hits = _KNOWN_TOPICS_SET & msg.keys()
+    if hits:
+        if len(hits) == 1:
+            return next(iter(hits))
+        for k in _KNOWN_TOPICS:
+            if k in hits:
+                return k
     # fallback: if exactly one key, treat it as topic
-    if len(msg.keys()) == 1:
-        return list(msg.keys())[0]
+    if len(msg) == 1:
+        return next(iter(msg))
     return "unknown"
 
 
-def extract_mac_bssid(msg: dict) -> tuple[str, str]:
-    mac = ""
-    bssid = ""
-
+# Nested records that carry device identity, as (topic record key, field key).
+# Later entries win, matching the previous sequential overrides.
+_MAC_SOURCES = (
     # DOT11_NEW_SSID_BASEDEV often contains base device record
-    base = msg.get("DOT11_NEW_SSID_BASEDEV")
-    if isinstance(base, dict):
-        mac = base.get("kismet.device.base.macaddr") or mac
-
+    ("DOT11_NEW_SSID_BASEDEV", "kismet.device.base.macaddr"),
     # WPA handshake events embed base + dot11-specific keys (per docs)
-    base2 = msg.get("DOT11_WPA_HANDSHAKE_BASEDEV")
-    if isinstance(base2, dict):
-        mac = base2.get("kismet.device.base.macaddr") or mac
+    ("DOT11_WPA_HANDSHAKE_BASEDEV", "kismet.device.base.macaddr"),
+)
+_BSSID_SOURCES = (("DOT11_WPA_HANDSHAKE_DOT11", "dot11.device.last_bssid"),)
+_NESTED_KEYS = frozenset(k for k, _ in _MAC_SOURCES + _BSSID_SOURCES)
+# Flat keys checked last as a fallback; the last string value found wins.
+_FALLBACK_MAC_KEYS = ("mac", "macaddr", "client_mac", "kismet.device.base.macaddr")
 
-    dot11 = msg.get("DOT11_WPA_HANDSHAKE_DOT11")
-    if isinstance(dot11, dict):
-        bssid = dot11.get("dot11.device.last_bssid") or bssid
+
+def extract_mac_bssid(msg: dict) -> tuple[str, str]:
+    mac = ""
+    bssid = ""
+    get = msg.get
+
+    # Most topics carry none of the nested records; skip the lookups entirely.
+    if not _NESTED_KEYS.isdisjoint(msg.keys()):
+        for outer, field in _MAC_SOURCES:
+            rec = get(outer)
+            if isinstance(rec, dict):
+                mac = rec.get(field) or mac
+        for outer, field in _BSSID_SOURCES:
+            rec = get(outer)
+            if isinstance(rec, dict):
+                bssid = rec.get(field) or bssid
 
     # As a fallback, look for obvious keys
-    for k in ("mac", "macaddr", "client_mac", "kismet.device.base.macaddr"):
-        if k in msg and isinstance(msg.get(k), str):
-            mac = msg.get(k)
+    for k in _FALLBACK_MAC_KEYS:
+        v = get(k)
+        if type(v) is str:
+            mac = v
 
     if mac:
         mac = _lower_mac(mac)
@@ -134,41 +213,197 @@ def extract_mac_bssid(msg: dict) -> tuple[str, str]:
     return mac, bssid
 
 
-def append_raw(j: dict) -> tuple[int, int]:
-    os.makedirs(os.path.dirname(raw_path()), exist_ok=True)
-    raw = (json.dumps({"received_at": iso_now(), "event": j}, ensure_ascii=False) + "\n").encode("utf-8")
-    gz = gzip.compress(raw)
-    with open(raw_path(), "ab") as f:
-        f.write(gz)
-    return len(raw), len(gz)
+# One gzip stream per process and day. Compressing each event as its own gzip
+# member re-initialized deflate state per frame and hurt both CPU and ratio.
+# Level 1 keeps CPU low for an always-on collector. The member is only
+# terminated by close_raw(), so each stream gets its own file (see raw_path).
+_raw_day: str | None = None
+_raw_gz: gzip.GzipFile | None = None
+_raw_out: io.BufferedWriter | None = None
+_raw_pos = 0
+
+
+def _raw_writer() -> io.BufferedWriter:
+    global _raw_day, _raw_gz, _raw_out, _raw_pos
+    day = day_local()
+    if _raw_out is None or day != _raw_day:
+        close_raw()
+        path = raw_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _raw_gz = _GzipFile(path, "wb", compresslevel=1)
+        _raw_out = io.BufferedWriter(_raw_gz, buffer_size=131072)
+        _raw_pos = _raw_gz.fileobj.tell()
+        _raw_day = day
+    return _raw_out
+
+
+def flush_raw() -> None:
+    """Push buffered records through the compressor and out to disk."""
+    if _raw_out is not None:
+        _raw_out.flush()
+        _raw_gz.flush()
+
+
+def close_raw() -> None:
+    global _raw_gz, _raw_out
+    if _raw_out is not None:
+        _raw_out.close()
+    _raw_gz = None
+    _raw_out = None
+
+
+atexit.register(close_raw)
+
+
+def append_raw(payload: bytes, ts: int) -> tuple[int, int]:
+    """Append one event record received at epoch second ts; returns (raw_bytes, gz_bytes).
+
+    gz_bytes is the growth of the compressed file since the previous call, so
+    it is an estimate: buffered records show 0 and the record that triggers a
+    buffer drain carries the compressed size of the whole chunk.
+    """
+    global _raw_pos
+    # Splice the already-serialized event into the envelope instead of
+    # encoding it a second time.
+    raw = b'{"received_at":"' + _format_second(ts)[1] + b'","event":' + payload + b"}\n"
+    _raw_writer().write(raw)
+    pos = _raw_gz.fileobj.tell()
+    gz_bytes = pos - _raw_pos
+    _raw_pos = pos
+    return len(raw), gz_bytes
+
+
+# Events are committed in batches; a commit per event fsyncs the WAL on every frame.
+FLUSH_MAX_EVENTS = 500
+FLUSH_INTERVAL_S = 1.0
+
+INSERT_EVENT_SQL = """
+INSERT INTO eventbus_events
+  (ts, topic, mac, bssid, raw_bytes, gzip_bytes, payload_json, payload_bytes)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
+# Oversized payloads are cut and marked; payload_bytes keeps the true size.
+PAYLOAD_MAX_BYTES = 200000
+PAYLOAD_TRUNC_MARKER = "...TRUNC"
 
-def store_event(con: sqlite3.Connection, topic: str, mac: str, bssid: str, raw_bytes: int, gz_bytes: int, payload: dict):
-    ts = int(time.time())
-    con.execute(
-        """
-        INSERT INTO eventbus_events
-          (ts, topic, mac, bssid, raw_bytes, gzip_bytes, payload_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (ts, topic, mac or "", bssid or "", raw_bytes, gz_bytes, json.dumps(payload, sort_keys=True)[:200000]),
-    )
-    con.commit()
+
+def event_row(ts: int, topic: str, mac: str, bssid: str, raw_bytes: int, gz_bytes: int, payload: bytes) -> tuple:
+    n = len(payload)
+    if n <= PAYLOAD_MAX_BYTES:
+        payload_json = payload.decode("utf-8")
+    else:
+        # Cut on bytes; a split multi-byte sequence at the tail is dropped on decode.
+        head = payload[: PAYLOAD_MAX_BYTES - len(PAYLOAD_TRUNC_MARKER)]
+        payload_json = head.decode("utf-8", errors="ignore") + PAYLOAD_TRUNC_MARKER
+    return (ts, topic, mac or "", bssid or "", raw_bytes, gz_bytes, payload_json, n)
 
 
-def ensure_meta(con: sqlite3.Connection, key: str, val: str):
+def flush_events(con: sqlite3.Connection, rows: list[tuple]) -> None:
+    """Insert pending event rows and bump last_event_at in one transaction."""
+    if not rows:
+        return
+    with con:
+        con.executemany(INSERT_EVENT_SQL, rows)
+        ensure_meta(con, "eventbus_collector.last_event_at", iso_now(), commit=False)
+    rows.clear()
+
+
+def ensure_meta(con: sqlite3.Connection, key: str, val: str, commit: bool = True):
     con.execute(
         "INSERT OR REPLACE INTO meta_kv(k,v,updated_at) VALUES (?,?,?)",
         (key, val, iso_now()),
     )
-    con.commit()
+    if commit:
+        con.commit()
+
+
+# Frames waiting for the persistence thread. Bounded so a stalled disk applies
+# backpressure to the websocket instead of growing memory without limit.
+QUEUE_MAX_FRAMES = 10000
+
+
+def persist_batch(con: sqlite3.Connection, frames: list) -> None:
+    """Parse, log and store a batch of (ts, raw frame) pairs (runs on the DB thread)."""
+    rows: list[tuple] = []
+    for ts, raw in frames:
+        try:
+            j = orjson.loads(raw)
+        except Exception:
+            continue
+        if not isinstance(j, dict):
+            continue  # valid JSON but not an event object; skip just this frame
+        topic = detect_topic(j)
+        mac, bssid = extract_mac_bssid(j)
+        payload = orjson.dumps(j, option=orjson.OPT_SORT_KEYS)
+        rb, gb = append_raw(payload, ts)
+        rows.append(event_row(ts, topic, mac, bssid, rb, gb, payload))
+    flush_raw()
+    flush_events(con, rows)
+
+
+async def persist_worker(q: asyncio.Queue, con: sqlite3.Connection, db_thread: ThreadPoolExecutor) -> None:
+    """Drain the frame queue in batches of up to FLUSH_MAX_EVENTS / FLUSH_INTERVAL_S.
+
+    A None on the queue persists whatever is pending and ends the worker.
+    """
+    loop = asyncio.get_running_loop()
+    stop = False
+    while not stop:
+        frame = await q.get()
+        if frame is None:
+            return
+        batch = [frame]
+        deadline = loop.time() + FLUSH_INTERVAL_S
+        while len(batch) < FLUSH_MAX_EVENTS:
+            try:
+                frame = q.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    frame = await asyncio.wait_for(q.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if frame is None:
+                stop = True
+                break
+            batch.append(frame)
+        try:
+            await loop.run_in_executor(db_thread, persist_batch, con, batch)
+        except Exception as e:
+            # Drop the batch but keep draining; a dead worker would stall the recv loop.
+            try:
+                await loop.run_in_executor(
+                    db_thread, ensure_meta, con, "eventbus_collector.status", f"error: {type(e).__name__}: {e}"
+                )
+            except Exception:
+                pass
 
 
 async def main():
+    # Resolve (and validate) the URL before connecting; reconnects reuse it.
     url = build_ws_url()
 
-    con = dbm.connect(db_path())
-    dbm.init_db(con)
+    # All sqlite and raw-file work happens on one dedicated thread so the event
+    # loop only receives frames; the connection never crosses threads.
+    loop = asyncio.get_running_loop()
+    db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="eventbus-db")
+
+    def open_db() -> sqlite3.Connection:
+        con = dbm.connect(db_path())
+        dbm.init_db(con)
+        return con
+
+    def close_db() -> None:
+        close_raw()
+        con.close()
+
+    async def meta(key: str, val: str) -> None:
+        await loop.run_in_executor(db_thread, ensure_meta, con, key, val)
+
+    con = await loop.run_in_executor(db_thread, open_db)
 
     subs = [
         "DOT11_PROBED_SSID",
@@ -177,32 +412,40 @@ async def main():
         "ALERT",
     ]
 
-    ensure_meta(con, "eventbus_collector.status", "starting")
-
-    while True:
-        try:
-            async with websockets.connect(url, open_timeout=15, close_timeout=5, ping_interval=20) as ws:
-                ensure_meta(con, "eventbus_collector.status", "connected")
-                ensure_meta(con, "eventbus_collector.connected_at", iso_now())
-
-                for t in subs:
-                    await ws.send(json.dumps({"SUBSCRIBE": t}))
-
-                while True:
-                    raw = await ws.recv()
-                    try:
-                        j = json.loads(raw)
-                    except Exception:
-                        continue
-
-                    topic = detect_topic(j)
-                    mac, bssid = extract_mac_bssid(j)
-                    rb, gb = append_raw(j)
-                    store_event(con, topic, mac, bssid, rb, gb, j)
-                    ensure_meta(con, "eventbus_collector.last_event_at", iso_now())
-        except Exception as e:
-            ensure_meta(con, "eventbus_collector.status", f"error: {type(e).__name__}: {e}")
-            await asyncio.sleep(5)
+    await meta("eventbus_collector.status", "starting")
+
+    q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX_FRAMES)
+    worker = asyncio.create_task(persist_worker(q, con, db_thread))  # keep a reference
+
+    # As PID 1 in Docker, SIGTERM (docker stop) would otherwise kill the process
+    # without running atexit, leaving the raw gzip member unterminated.
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    try:
+        while True:
+            try:
+                async with websockets.connect(url, open_timeout=15, close_timeout=5, ping_interval=20) as ws:
+                    await meta("eventbus_collector.status", "connected")
+                    await meta("eventbus_collector.connected_at", iso_now())
+
+                    for t in subs:
+                        await ws.send(json.dumps({"SUBSCRIBE": t}))
+
+                    while True:
+                        frame = await ws.recv()
+                        # Stamp on arrival; batching and backpressure delay persistence.
+                        await q.put((int(time.time()), frame))
+            except Exception as e:
+                await meta("eventbus_collector.status", f"error: {type(e).__name__}: {e}")
+                await asyncio.sleep(5)
+    except asyncio.CancelledError:
+        pass  # clean stop: persist queued frames and close the raw segment
+    finally:
+        await q.put(None)
+        await worker
+        await meta("eventbus_collector.status", "stopped")
+        await loop.run_in_executor(db_thread, close_db)
+        db_thread.shutdown()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,35 @@
 #!/usr/bin/env python3
 """Minimal HomeSigSec dashboard API.
 
-This mirrors the HomeNetSec pattern: persist small user feedback locally under output/state.
+This mirrors the HomeNetSec pattern: persist small user feedback locally under output/state
+(the `feedback` table in homesigsec.sqlite; a legacy feedback.json is imported once).
 No secrets are embedded.
 """
 
 from __future__ import annotations
 
-import json
 import os
+import queue
 import sqlite3
 import time
-from flask import Flask, request, jsonify
+
+import orjson
+from flask import Flask, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serve jsonify()/request.get_json() through orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 
 def workdir() -> str:
@@ -24,20 +40,61 @@ def db_path() -> str:
     return os.path.join(workdir(), "state", "homesigsec.sqlite")
 
 
+# Idle connections, shared across requests. The dev server handles each request
+# on a new thread, so connections are pooled rather than kept thread-local.
+_db_pool: queue.SimpleQueue[sqlite3.Connection] = queue.SimpleQueue()
+
+
 def get_db() -> sqlite3.Connection:
-    con = sqlite3.connect(db_path())
-    con.row_factory = sqlite3.Row
+    """Return this app context's connection, reusing a pooled one if available."""
+    con = g.get("_db")
+    if con is None:
+        try:
+            con = _db_pool.get_nowait()
+        except queue.Empty:
+            con = sqlite3.connect(db_path(), check_same_thread=False)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA synchronous=NORMAL")
+        g._db = con
     return con
 
 
+@app.teardown_appcontext
+def _release_db(exc) -> None:
+    con = g.pop("_db", None)
+    if con is not None:
+        if con.in_transaction:
+            con.rollback()
+        _db_pool.put(con)
+
+
 def feedback_path() -> str:
     return os.path.join(workdir(), "state", "feedback.json")
 
 
+FEEDBACK_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS feedback (
+  day TEXT NOT NULL,
+  alert_id TEXT NOT NULL,
+  verdict TEXT NOT NULL,
+  note TEXT NOT NULL,
+  dismissed INTEGER NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (day, alert_id)
+)
+"""
+
+UPSERT_FEEDBACK_SQL = """
+INSERT OR REPLACE INTO feedback (day, alert_id, verdict, note, dismissed, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
 def _load() -> dict:
+    """Read the legacy feedback.json (pre-sqlite storage)."""
     try:
-        with open(feedback_path(), "r", encoding="utf-8") as f:
-            j = json.load(f)
+        with open(feedback_path(), "rb") as f:
+            j = orjson.loads(f.read())
             return j if isinstance(j, dict) else {"days": {}}
     except FileNotFoundError:
         return {"days": {}}
@@ -45,21 +102,46 @@ def _load() -> dict:
         return {"days": {}}
 
 
-def _save(j: dict) -> None:
-    os.makedirs(os.path.dirname(feedback_path()), exist_ok=True)
-    tmp = feedback_path() + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(j, f, indent=2, sort_keys=True)
-        f.write("\n")
-    os.replace(tmp, feedback_path())
+def init_feedback() -> None:
+    """Create the feedback table; import legacy feedback.json into it once."""
+    os.makedirs(os.path.dirname(db_path()), exist_ok=True)
+    with app.app_context():
+        con = get_db()
+        con.execute(FEEDBACK_SCHEMA_SQL)
+        if con.execute("SELECT 1 FROM feedback LIMIT 1").fetchone() is None:
+            days = _load().get("days")
+            rows = []
+            for day, recs in (days.items() if isinstance(days, dict) else ()):
+                if not isinstance(recs, dict):
+                    continue
+                for alert_id, rec in recs.items():
+                    if not isinstance(rec, dict):
+                        continue
+                    # The JSON store accepted any value; coerce like put_feedback().
+                    rows.append((
+                        str(day), str(alert_id), str(rec.get("verdict") or "unsure"), str(rec.get("note") or ""),
+                        int(bool(rec.get("dismissed"))), str(rec.get("updated_at") or ""),
+                    ))
+            con.executemany(UPSERT_FEEDBACK_SQL, rows)
+        con.commit()
 
 
 @app.get("/feedback")
 def get_feedback():
     day = request.args.get("day", "")
-    db = _load()
-    days = db.get("days") if isinstance(db.get("days"), dict) else {}
-    return jsonify({"day": day, "feedback": (days.get(day) or {})})
+    rows = get_db().execute(
+        "SELECT alert_id, verdict, note, dismissed, updated_at FROM feedback WHERE day = ?", (day,)
+    ).fetchall()
+    feedback = {
+        r["alert_id"]: {
+            "updated_at": r["updated_at"],
+            "verdict": r["verdict"],
+            "note": r["note"],
+            "dismissed": bool(r["dismissed"]),
+        }
+        for r in rows
+    }
+    return jsonify({"day": day, "feedback": feedback})
 
 
 @app.post("/feedback")
@@ -70,60 +152,55 @@ def put_feedback():
     if not day or not alert_id:
         return jsonify({"ok": False, "error": "missing day/alert_id"}), 400
 
-    rec = {
-        "updated_at": body.get("updated_at") or time.strftime("%Y-%m-%dT%H:%M:%S%z"),
-        "verdict": body.get("verdict") or "unsure",
-        "note": body.get("note") or "",
-        "dismissed": bool(body.get("dismissed")),
-    }
+    con = get_db()
+    con.execute(UPSERT_FEEDBACK_SQL, (
+        day,
+        alert_id,
+        str(body.get("verdict") or "unsure"),
+        str(body.get("note") or ""),
+        int(bool(body.get("dismissed"))),
+        str(body.get("updated_at") or time.strftime("%Y-%m-%dT%H:%M:%S%z")),
+    ))
+    con.commit()
+    return jsonify({"ok": True})
 
-    db = _load()
-    db.setdefault("days", {})
-    if not isinstance(db["days"], dict):
-        db["days"] = {}
-    db["days"].setdefault(day, {})
-    if not isinstance(db["days"][day], dict):
-        db["days"][day] = {}
-    db["days"][day][alert_id] = rec
 
-    _save(db)
-    return jsonify({"ok": True})
+FINGERPRINTS_SQL = """
+SELECT device_mac, label, baseline_hash, baseline_established_at, baseline_packets,
+       last_observed_hash, last_observed_at, last_packets_total,
+       observations_count, match_count, drift_count, confidence, feature_weights_json
+FROM device_fingerprints
+ORDER BY label, device_mac
+"""
+
+
+def _fingerprint_obj(r: sqlite3.Row) -> dict:
+    return {
+        "mac": r["device_mac"],
+        "label": r["label"],
+        "baseline_hash": r["baseline_hash"],
+        "baseline_established_at": r["baseline_established_at"],
+        "baseline_packets": r["baseline_packets"],
+        "last_observed_hash": r["last_observed_hash"],
+        "last_observed_at": r["last_observed_at"],
+        "last_packets": r["last_packets_total"],
+        "observations": r["observations_count"],
+        "matches": r["match_count"],
+        "drifts": r["drift_count"],
+        "confidence": r["confidence"],
+        "weights": orjson.loads(r["feature_weights_json"]) if r["feature_weights_json"] else {},
+        "status": "drift" if (r["last_observed_hash"] and r["baseline_hash"] and r["last_observed_hash"] != r["baseline_hash"]) else "ok"
+    }
 
 
 @app.get("/fingerprints")
 def get_fingerprints():
     """Return fingerprint status for all tracked devices."""
+    # Built in full before responding (the table holds one row per tracked
+    # device) so any row error still yields the error body, not a cut-off stream.
     try:
-        con = get_db()
-        rows = con.execute("""
-            SELECT device_mac, label, baseline_hash, baseline_established_at, baseline_packets,
-                   last_observed_hash, last_observed_at, last_packets_total,
-                   observations_count, match_count, drift_count, confidence, feature_weights_json
-            FROM device_fingerprints
-            ORDER BY label, device_mac
-        """).fetchall()
-        con.close()
-        
-        devices = []
-        for r in rows:
-            devices.append({
-                "mac": r["device_mac"],
-                "label": r["label"],
-                "baseline_hash": r["baseline_hash"],
-                "baseline_established_at": r["baseline_established_at"],
-                "baseline_packets": r["baseline_packets"],
-                "last_observed_hash": r["last_observed_hash"],
-                "last_observed_at": r["last_observed_at"],
-                "last_packets": r["last_packets_total"],
-                "observations": r["observations_count"],
-                "matches": r["match_count"],
-                "drifts": r["drift_count"],
-                "confidence": r["confidence"],
-                "weights": json.loads(r["feature_weights_json"]) if r["feature_weights_json"] else {},
-                "status": "drift" if (r["last_observed_hash"] and r["baseline_hash"] and r["last_observed_hash"] != r["baseline_hash"]) else "ok"
-            })
-        
-        return jsonify({"fingerprints": devices})
+        cur = get_db().execute(FINGERPRINTS_SQL)
+        return jsonify({"fingerprints": [_fingerprint_obj(r) for r in cur]})
     except Exception as e:
         return jsonify({"fingerprints": [], "error": str(e)})
 
@@ -132,18 +209,19 @@ def get_fingerprints():
 def get_fingerprint_status():
     """Return current run status for fingerprint devices."""
     try:
-        con = get_db()
-        rows = con.execute("""
+        rows = get_db().execute("""
             SELECT device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at
             FROM fingerprint_device_status
             ORDER BY label, device_mac
         """).fetchall()
-        con.close()
         
         return jsonify({"status": [dict(r) for r in rows]})
     except Exception as e:
         return jsonify({"status": [], "error": str(e)})
 
 
+init_feedback()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
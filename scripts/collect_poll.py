@@ -16,19 +16,59 @@ import gzip
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import db as dbm
 from kismet_client import post_json
+from util import maybe_int
 
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
-def iso_now() -> str:
-    return dt.datetime.now(dt.timezone.utc).astimezone().strftime("%Y-%m-%dT%H:%M:%S%z")
 
+def _dumps(obj) -> bytes:
+    """Compact UTF-8 JSON, via orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
-def write_raw(workdir: str, view: str, since: str, payload_obj) -> tuple[str, int, int]:
-    day = dt.datetime.now().astimezone().strftime("%Y-%m-%d")
+
+# Kismet field names looked up for every device in the ingest loops.
+_K_MAC = "kismet.device.base.macaddr"
+_K_TYPE = "kismet.device.base.type"
+_K_FIRST = "kismet.device.base.first_time"
+_K_LAST = "kismet.device.base.last_time"
+_K_CHANNEL = "kismet.device.base.channel"
+_K_FREQ = "kismet.device.base.frequency"
+_K_SIGNAL = "kismet.device.base.signal"
+_K_LAST_SIGNAL = "kismet.common.signal.last_signal"
+_K_DOT11 = "dot11.device"
+_K_SSID_MAP = "dot11.device.advertised_ssid_map"
+_K_SSID = "dot11.advertisedssid.ssid"
+_K_LAST_BSSID = "dot11.device.last_bssid"
+_K_TYPESET = "dot11.device.typeset"
+_K_PACKETS = "kismet.device.base.packets"
+_K_PACKETS_TOTAL = "kismet.device.base.packets.total"
+_K_PACKETS_DATA = "kismet.device.base.packets.data"
+_K_DATASIZE = "kismet.device.base.datasize"
+
+
+def iso_now(now: dt.datetime | None = None) -> str:
+    if now is None:
+        now = dt.datetime.now(dt.timezone.utc).astimezone()
+    return now.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
+_raw_dirs: set[str] = set()  # day directories already created by this process
+
+
+def write_raw(workdir: str, view: str, since: str, payload_obj, day: str) -> tuple[str, int, int]:
     out_dir = os.path.join(workdir, "raw", day)
-    os.makedirs(out_dir, exist_ok=True)
+    if out_dir not in _raw_dirs:
+        os.makedirs(out_dir, exist_ok=True)
+        _raw_dirs.add(out_dir)
     out_path = os.path.join(out_dir, f"{view}.json.gz")
 
     record = {
@@ -37,8 +77,12 @@ def write_raw(workdir: str, view: str, since: str, payload_obj) -> tuple[str, in
         "since": since,
         "payload": payload_obj,
     }
-    raw = (json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
-    gz = gzip.compress(raw)
+    raw = _dumps(record) + b"\n"
+    # One complete gzip member per snapshot, written in a single call, so a
+    # killed run never leaves an unterminated member for the next poll to
+    # append after. Level 1: snapshots only live for 7 days, so CPU beats
+    # the last few % of ratio.
+    gz = gzip.compress(raw, compresslevel=1)
     with open(out_path, "ab") as f:
         f.write(gz)
     return out_path, len(raw), len(gz)
@@ -54,152 +98,200 @@ def _get_items(resp):
     return []
 
 
-def _maybe_int(x):
-    try:
-        if x is None:
-            return None
-        if isinstance(x, bool):
-            return int(x)
-        if isinstance(x, (int, float)):
-            return int(x)
-        if isinstance(x, str) and x.strip():
-            return int(float(x.strip()))
-    except Exception:
-        return None
-    return None
-
-
 def ingest_ap_view(con, ts_now: int, view: str, items: list[dict]):
-    cur = con.cursor()
+    # Keyed by the table's primary key (ts is fixed per call). A BSSID can list
+    # the same SSID more than once; collapsing here (last wins, as REPLACE would)
+    # saves sqlite a delete+insert and index rewrite per duplicate.
+    rows = {}
     for it in items:
         if not isinstance(it, dict):
             continue
-        bssid = it.get("kismet.device.base.macaddr")
+        bssid = it.get(_K_MAC)
         bssid = str(bssid).lower() if bssid else bssid
-        last_time = _maybe_int(it.get("kismet.device.base.last_time"))
-        first_time = _maybe_int(it.get("kismet.device.base.first_time"))
-        channel = it.get("kismet.device.base.channel")
-        freq = _maybe_int(it.get("kismet.device.base.frequency"))
+        last_time = maybe_int(it.get(_K_LAST))
+        first_time = maybe_int(it.get(_K_FIRST))
+        channel = it.get(_K_CHANNEL)
+        freq = maybe_int(it.get(_K_FREQ))
 
         # signal may be nested or promoted
-        sig = _maybe_int(it.get("kismet.common.signal.last_signal"))
+        sig = maybe_int(it.get(_K_LAST_SIGNAL))
         if sig is None:
-            s = it.get("kismet.device.base.signal")
+            s = it.get(_K_SIGNAL)
             if isinstance(s, dict):
-                sig = _maybe_int(s.get("kismet.common.signal.last_signal"))
+                sig = maybe_int(s.get(_K_LAST_SIGNAL))
 
         # SSID(s) can appear either nested under it['dot11.device'] (full records)
         # or promoted to a flat key like 'dot11.device.advertised_ssid_map' when using
         # field simplification.
         amap = None
-        dot11 = it.get("dot11.device") if isinstance(it.get("dot11.device"), dict) else None
+        dot11 = it.get(_K_DOT11)
         if isinstance(dot11, dict):
-            amap = dot11.get("dot11.device.advertised_ssid_map")
+            amap = dot11.get(_K_SSID_MAP)
         if amap is None:
-            amap = it.get("dot11.device.advertised_ssid_map")
+            amap = it.get(_K_SSID_MAP)
         if not isinstance(amap, list):
             amap = []
 
         for rec in amap:
             if not isinstance(rec, dict):
                 continue
-            ssid = rec.get("dot11.advertisedssid.ssid")
+            ssid = rec.get(_K_SSID)
             if ssid is None:
                 continue
-            cur.execute(
-                """
-                INSERT OR REPLACE INTO wifi_ap_sightings
-                  (ts, ssid, bssid, channel, frequency, signal_dbm, first_seen, last_seen, source)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (ts_now, ssid, bssid, channel, freq, sig, first_time, last_time, view),
-            )
-    con.commit()
+            # sqlite treats NULLs in a primary key as distinct, so those rows never collide.
+            key = (bssid, ssid) if bssid is not None else len(rows)
+            rows[key] = (ts_now, ssid, bssid, channel, freq, sig, first_time, last_time, view)
+
+    # One transaction per view; a failure rolls back instead of leaving
+    # partial rows for the poll_runs audit commit to pick up.
+    with con:
+        con.executemany(
+            """
+            INSERT OR REPLACE INTO wifi_ap_sightings
+              (ts, ssid, bssid, channel, frequency, signal_dbm, first_seen, last_seen, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows.values(),
+        )
 
 
 def _infer_ssid_for_bssid(con, bssid: str) -> str:
     # Use most recent AP sighting for this BSSID.
-    try:
-        row = con.execute(
-            """
-            SELECT ssid FROM wifi_ap_sightings
-            WHERE bssid = ? AND ssid IS NOT NULL AND ssid != ''
-            ORDER BY ts DESC
-            LIMIT 1
-            """,
-            (bssid,),
-        ).fetchone()
-        if row and row[0]:
-            return str(row[0])
-    except Exception:
-        return ""
+    row = con.execute(
+        """
+        SELECT ssid FROM wifi_ap_sightings
+        WHERE bssid = ? AND ssid IS NOT NULL AND ssid != ''
+        ORDER BY ts DESC
+        LIMIT 1
+        """,
+        (bssid,),
+    ).fetchone()
+    if row and row[0]:
+        return str(row[0])
     return ""
 
 
 def ingest_client_view(con, ts_now: int, view: str, items: list[dict]):
-    cur = con.cursor()
+    rows = {}  # by primary key, as in ingest_ap_view
+    # Many clients share a handful of APs; look each BSSID up once per call.
+    ssid_by_bssid: dict[str, str] = {}
     for it in items:
         if not isinstance(it, dict):
             continue
 
-        typ = (it.get("kismet.device.base.type") or "").strip()
+        typ = (it.get(_K_TYPE) or "").strip()
         if typ not in ("Wi-Fi Client", "Wi-Fi Device"):
             # Keep it conservative; AP types would create noise.
             continue
 
-        mac = it.get("kismet.device.base.macaddr")
+        mac = it.get(_K_MAC)
         if not mac:
             continue
         mac = str(mac).lower()
 
-        last_time = _maybe_int(it.get("kismet.device.base.last_time"))
-        first_time = _maybe_int(it.get("kismet.device.base.first_time"))
+        last_time = maybe_int(it.get(_K_LAST))
+        first_time = maybe_int(it.get(_K_FIRST))
 
-        sig = _maybe_int(it.get("kismet.common.signal.last_signal"))
+        sig = maybe_int(it.get(_K_LAST_SIGNAL))
         if sig is None:
-            s = it.get("kismet.device.base.signal")
+            s = it.get(_K_SIGNAL)
             if isinstance(s, dict):
-                sig = _maybe_int(s.get("kismet.common.signal.last_signal"))
+                sig = maybe_int(s.get(_K_LAST_SIGNAL))
 
         # associated bssid
         assoc = None
-        dot11 = it.get("dot11.device") if isinstance(it.get("dot11.device"), dict) else None
+        dot11 = it.get(_K_DOT11)
         if isinstance(dot11, dict):
-            assoc = dot11.get("dot11.device.last_bssid")
+            assoc = dot11.get(_K_LAST_BSSID)
         if assoc is None:
-            assoc = it.get("dot11.device.last_bssid")
+            assoc = it.get(_K_LAST_BSSID)
         assoc = str(assoc).lower() if assoc else ""
 
         # typeset - bitmask indicating frame types seen
         typeset = None
         if isinstance(dot11, dict):
-            typeset = _maybe_int(dot11.get("dot11.device.typeset"))
+            typeset = maybe_int(dot11.get(_K_TYPESET))
         if typeset is None:
-            typeset = _maybe_int(it.get("dot11.device.typeset"))
+            typeset = maybe_int(it.get(_K_TYPESET))
 
         # Packet counts - key indicators of actual connection
         # packets.total = all frames
         # packets.data = DATA frames only (To-DS/From-DS) - definitive proof of association
-        packets = _maybe_int(it.get("kismet.device.base.packets.total"))
+        packets = maybe_int(it.get(_K_PACKETS_TOTAL))
         packets_data = None
-        pkts_obj = it.get("kismet.device.base.packets")
+        pkts_obj = it.get(_K_PACKETS)
         if isinstance(pkts_obj, dict):
-            packets_data = _maybe_int(pkts_obj.get("kismet.device.base.packets.data"))
+            packets_data = maybe_int(pkts_obj.get(_K_PACKETS_DATA))
         if packets_data is None:
-            packets_data = _maybe_int(it.get("kismet.device.base.packets.data"))
-        datasize = _maybe_int(it.get("kismet.device.base.datasize"))
+            packets_data = maybe_int(it.get(_K_PACKETS_DATA))
+        datasize = maybe_int(it.get(_K_DATASIZE))
+
+        ssid = ""
+        if assoc:
+            ssid = ssid_by_bssid.get(assoc)
+            if ssid is None:
+                ssid = ssid_by_bssid[assoc] = _infer_ssid_for_bssid(con, assoc)
 
-        ssid = _infer_ssid_for_bssid(con, assoc) if assoc else ""
+        rows[(mac, assoc, ssid)] = (ts_now, mac, assoc, ssid, sig, typeset, packets, packets_data, datasize, first_time, last_time, view)
 
-        cur.execute(
+    with con:
+        con.executemany(
             """
             INSERT OR REPLACE INTO wifi_client_sightings
               (ts, client_mac, associated_bssid, ssid, signal_dbm, typeset, packets, packets_data, datasize, first_seen, last_seen, source)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (ts_now, mac, assoc, ssid, sig, typeset, packets, packets_data, datasize, first_time, last_time, view),
+            rows.values(),
         )
-    con.commit()
+
+
+def view_request(view: str, full: bool, since: str | None = None) -> tuple[str, dict]:
+    """Kismet path and POST payload for one device view.
+
+    With ``since``, only devices active since that last-time value are requested.
+    """
+    # NOTE: Some Kismet views may not return results for short last-time windows,
+    # so the full view stays the default; continuous capture is the eventbus collector's job.
+    if since:
+        path = f"/devices/views/{view}/last-time/{since}/devices.json"
+    else:
+        path = f"/devices/views/{view}/devices.json"
+
+    payload = {"start": 0, "length": 5000, "datatable": False}
+    if not full:
+        # minimal fields to keep storage manageable (per view)
+        if view == "phydot11_accesspoints":
+            payload["fields"] = [
+                "kismet.device.base.macaddr",
+                "kismet.device.base.first_time",
+                "kismet.device.base.last_time",
+                "kismet.device.base.channel",
+                "kismet.device.base.frequency",
+                "kismet.device.base.signal/kismet.common.signal.last_signal",
+                "dot11.device/dot11.device.advertised_ssid_map",
+            ]
+        elif view == "phy-IEEE802.11":
+            payload["fields"] = [
+                "kismet.device.base.macaddr",
+                "kismet.device.base.type",
+                "kismet.device.base.first_time",
+                "kismet.device.base.last_time",
+                "kismet.device.base.signal/kismet.common.signal.last_signal",
+                "kismet.device.base.packets.total",
+                "kismet.device.base.packets.data",
+                "kismet.device.base.datasize",
+                "dot11.device/dot11.device.last_bssid",
+                "dot11.device/dot11.device.typeset",
+            ]
+        else:
+            payload["fields"] = [
+                "kismet.device.base.macaddr",
+                "kismet.device.base.type",
+                "kismet.device.base.first_time",
+                "kismet.device.base.last_time",
+            ]
+
+    return path, payload
 
 
 def main():
@@ -209,6 +301,8 @@ def main():
     ap.add_argument("--views", default="phydot11_accesspoints")
     ap.add_argument("--since", default="-300", help="Kismet last-time timestamp (e.g. -300 or epoch)")
     ap.add_argument("--full", action="store_true", help="Do not use field simplification")
+    ap.add_argument("--delta", action="store_true",
+                    help="Only fetch devices active since --since (Kismet last-time endpoint)")
     args = ap.parse_args()
     
     had_errors = False
@@ -217,15 +311,25 @@ def main():
     os.makedirs(workdir, exist_ok=True)
 
     db_path = os.path.join(workdir, "state", "homesigsec.sqlite")
-    con = dbm.connect(db_path)
+    # Ingest only reads single columns by index; plain tuples are enough.
+    con = dbm.connect(db_path, row_factory=False)
     dbm.init_db(con)
 
     ts_now = int(time.time())
 
     views = [v.strip() for v in args.views.split(",") if v.strip()]
 
+    # Kismet requests for all views go out concurrently; parsing the responses
+    # into sqlite stays on this thread, overlapping with the remaining fetches.
+    pool = ThreadPoolExecutor(max_workers=max(1, min(8, len(views))))
+    fetches = []
     for view in views:
-        started = iso_now()
+        started_dt = dt.datetime.now(dt.timezone.utc).astimezone()
+        fetches.append((view, started_dt, pool.submit(post_json, *view_request(view, args.full, args.since if args.delta else None))))
+
+    for view, started_dt, fetch in fetches:
+        started = iso_now(started_dt)
+        day = started_dt.strftime("%Y-%m-%d")
         status = "ok"
         err = ""
         raw_bytes = 0
@@ -233,50 +337,11 @@ def main():
         items_count = 0
 
         try:
-            # NOTE: Some Kismet views may not return results for short last-time windows.
-            # We'll start with /devices.json (optionally filtered later) and evolve toward
-            # eventbus/websocket for high-fidelity event capture.
-            path = f"/devices/views/{view}/devices.json"
-
-            payload = {"start": 0, "length": 5000, "datatable": False}
-            if not args.full:
-                # minimal fields to keep storage manageable (per view)
-                if view == "phydot11_accesspoints":
-                    payload["fields"] = [
-                        "kismet.device.base.macaddr",
-                        "kismet.device.base.first_time",
-                        "kismet.device.base.last_time",
-                        "kismet.device.base.channel",
-                        "kismet.device.base.frequency",
-                        "kismet.device.base.signal/kismet.common.signal.last_signal",
-                        "dot11.device/dot11.device.advertised_ssid_map",
-                    ]
-                elif view == "phy-IEEE802.11":
-                    payload["fields"] = [
-                        "kismet.device.base.macaddr",
-                        "kismet.device.base.type",
-                        "kismet.device.base.first_time",
-                        "kismet.device.base.last_time",
-                        "kismet.device.base.signal/kismet.common.signal.last_signal",
-                        "kismet.device.base.packets.total",
-                        "kismet.device.base.packets.data",
-                        "kismet.device.base.datasize",
-                        "dot11.device/dot11.device.last_bssid",
-                        "dot11.device/dot11.device.typeset",
-                    ]
-                else:
-                    payload["fields"] = [
-                        "kismet.device.base.macaddr",
-                        "kismet.device.base.type",
-                        "kismet.device.base.first_time",
-                        "kismet.device.base.last_time",
-                    ]
-
-            resp = post_json(path, payload)
+            resp = fetch.result()
             items = _get_items(resp)
             items_count = len(items)
 
-            _, rb, gb = write_raw(workdir, view, args.since, resp)
+            _, rb, gb = write_raw(workdir, view, args.since, resp, day)
             raw_bytes, gz_bytes = rb, gb
 
             if view == "phydot11_accesspoints":
@@ -304,6 +369,9 @@ def main():
         if err:
             print(f"[homesigsec] error: {err}")
 
+    pool.shutdown()
+    dbm.close(con)
+
     if had_errors:
         print("[homesigsec] FATAL: one or more views failed to poll")
         sys.exit(1)
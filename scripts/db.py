@@ -10,9 +10,22 @@ import os
 import sqlite3
 
 
+# journal_mode is stored in the database file; everything else here only lasts
+# for the connection, so connect() applies it rather than init_db().
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Bump on any SCHEMA_SQL change so existing databases pick it up.
+# Only this copy sets user_version; assets/collector/db.py always runs its script.
+SCHEMA_VERSION = 1
+
 SCHEMA_SQL = r"""
 PRAGMA journal_mode=WAL;
-PRAGMA synchronous=NORMAL;
 
 CREATE TABLE IF NOT EXISTS meta_kv (
   k TEXT PRIMARY KEY,
@@ -65,6 +78,8 @@ CREATE TABLE IF NOT EXISTS wifi_client_sightings (
 );
 CREATE INDEX IF NOT EXISTS idx_wifi_client_mac_ts ON wifi_client_sightings (client_mac, ts);
 CREATE INDEX IF NOT EXISTS idx_wifi_client_ssid_ts ON wifi_client_sightings (ssid, ts);
+-- Dashboard queries match on lower(client_mac), which cannot use the plain column index.
+CREATE INDEX IF NOT EXISTS idx_wifi_client_lower_mac_ts ON wifi_client_sightings (lower(client_mac), ts);
 
 CREATE TABLE IF NOT EXISTS bt_sightings (
   ts INTEGER NOT NULL,
@@ -126,6 +141,7 @@ CREATE TABLE IF NOT EXISTS device_fingerprints (
   last_seen INTEGER,
   updated_at TEXT NOT NULL
 );
+CREATE INDEX IF NOT EXISTS idx_device_fp_label_mac ON device_fingerprints (label, device_mac);
 
 CREATE TABLE IF NOT EXISTS eventbus_events (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -135,10 +151,12 @@ CREATE TABLE IF NOT EXISTS eventbus_events (
   bssid TEXT,
   raw_bytes INTEGER,
   gzip_bytes INTEGER,
-  payload_json TEXT NOT NULL
+  payload_json TEXT NOT NULL,
+  payload_bytes INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_eventbus_topic_ts ON eventbus_events (topic, ts);
 CREATE INDEX IF NOT EXISTS idx_eventbus_mac_ts ON eventbus_events (mac, ts);
+CREATE INDEX IF NOT EXISTS idx_eventbus_ts ON eventbus_events (ts);
 
 CREATE TABLE IF NOT EXISTS fingerprint_runs (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -167,16 +185,40 @@ CREATE TABLE IF NOT EXISTS alert_events (
   data_json TEXT
 );
 CREATE INDEX IF NOT EXISTS idx_alert_events_alert_ts ON alert_events (alert_id, ts);
+
+CREATE TABLE IF NOT EXISTS feedback (
+  day TEXT NOT NULL,
+  alert_id TEXT NOT NULL,
+  verdict TEXT NOT NULL,
+  note TEXT NOT NULL,
+  dismissed INTEGER NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (day, alert_id)
+);
 """
 
 
-def connect(db_path: str) -> sqlite3.Connection:
+def connect(db_path: str, row_factory: bool = True) -> sqlite3.Connection:
+    """Open the DB; pass row_factory=False when rows are only read by index."""
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     con = sqlite3.connect(db_path)
-    con.row_factory = sqlite3.Row
+    if row_factory:
+        con.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        con.execute(pragma)
     return con
 
 
 def init_db(con: sqlite3.Connection) -> None:
+    # Skip re-running the DDL on every poll once this schema version is in place.
+    if con.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
     con.executescript(SCHEMA_SQL)
+    con.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
     con.commit()
+
+
+def close(con: sqlite3.Connection) -> None:
+    """Let sqlite refresh planner statistics it found stale, then close."""
+    con.execute("PRAGMA optimize")
+    con.close()
@@ -35,6 +35,7 @@ import os
 import sqlite3
 import sys
 import time
+from urllib.error import HTTPError
 
 # Source env file if KISMET_URL not set (fix for cron persistence)
 def ensure_env():
@@ -54,6 +55,12 @@ ensure_env()
 
 import db as dbm
 from kismet_client import post_json
+from util import maybe_int
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
 TARGET_SSID = os.environ.get("HOMESIGSEC_TARGET_SSID", "MyHomeNetwork")
 
@@ -74,6 +81,47 @@ WEIGHT_MIN = 0.1
 WEIGHT_MAX = 2.0
 WEIGHT_INITIAL = 1.0
 
+STATUS_SQL = """INSERT OR REPLACE INTO fingerprint_device_status
+   (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
+   VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+BASELINE_INSERT_SQL = """
+    INSERT INTO device_fingerprints
+    (device_mac, label, baseline_hash, baseline_features_json, baseline_established_at,
+     baseline_packets, last_observed_hash, last_observed_features_json, last_observed_at,
+     last_packets_total, observations_count, match_count, drift_count, confidence,
+     feature_weights_json, data_bytes, first_seen, last_seen, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+BASELINE_UPDATE_SQL = """
+    UPDATE device_fingerprints SET
+        baseline_hash = ?, baseline_features_json = ?, baseline_established_at = ?,
+        baseline_packets = ?, last_observed_hash = ?, last_observed_features_json = ?,
+        last_observed_at = ?, last_packets_total = ?, observations_count = 1,
+        match_count = 1, drift_count = 0, confidence = ?,
+        feature_weights_json = ?, updated_at = ?
+    WHERE device_mac = ?
+"""
+
+OBSERVATION_UPDATE_SQL = """
+    UPDATE device_fingerprints SET
+        last_observed_hash = ?, last_observed_features_json = ?, last_observed_at = ?,
+        last_packets_total = ?, observations_count = ?, match_count = ?, drift_count = ?,
+        confidence = ?, feature_weights_json = ?, last_seen = ?, updated_at = ?
+    WHERE device_mac = ?
+"""
+
+COUNTER_UPDATE_SQL = """
+    UPDATE device_fingerprints SET
+        last_observed_at = ?, last_packets_total = ?, observations_count = ?,
+        match_count = ?, confidence = ?, last_seen = ?, updated_at = ?
+    WHERE device_mac = ?
+"""
+
+RUN_INSERT_SQL = """INSERT INTO fingerprint_runs(ts, updated_at, stored, insufficient, min_packets)
+   VALUES (?, ?, ?, ?, ?)"""
+
 
 def now_iso() -> str:
     return dt.datetime.now(dt.timezone.utc).astimezone().strftime("%Y-%m-%dT%H:%M:%S%z")
@@ -83,9 +131,40 @@ def lower_mac(m: str) -> str:
     return str(m).strip().lower()
 
 
+def _dumps_sorted(obj) -> bytes:
+    """Compact, key-sorted UTF-8 JSON.
+
+    orjson and the stdlib fallback produce identical bytes for feature values
+    (str/int/None), so fingerprint hashes are stable across both.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _loads(s: str):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
 def compute_hash(features: dict) -> str:
-    """Compute stable hash from feature dict."""
-    blob = json.dumps(features, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    """Compute stable hash from feature dict.
+
+    Stored as baseline_hash and compared to last_observed_hash by the dashboard,
+    so the algorithm must not change without rehashing existing baselines.
+    """
+    return _hash_blob(_dumps_sorted(features))
+
+
+def _hash_blob(blob: bytes) -> str:
+    """compute_hash for features already serialized with _dumps_sorted."""
     return hashlib.sha256(blob).hexdigest()[:16]
 
 
@@ -103,13 +182,13 @@ def extract_features(kismet_item: dict) -> dict:
 def compare_features(baseline: dict, observed: dict, weights: dict) -> tuple[float, dict]:
     """
     Compare observed features against baseline with weighting.
-    Returns (similarity_score, feature_match_details).
+    Returns (similarity_score, {feature: match}).
     
     Similarity is weighted average of feature matches.
     """
     total_weight = 0.0
     weighted_match = 0.0
-    details = {}
+    matches = {}
     
     for key in FEATURE_KEYS:
         w = weights.get(key, WEIGHT_INITIAL)
@@ -131,21 +210,33 @@ def compare_features(baseline: dict, observed: dict, weights: dict) -> tuple[flo
         else:
             match = 0.0
         
-        details[key] = {"match": match, "weight": w, "baseline": base_val, "observed": obs_val}
+        matches[key] = match
         total_weight += w
         weighted_match += match * w
     
     similarity = weighted_match / total_weight if total_weight > 0 else 0.0
-    return similarity, details
+    return similarity, matches
 
 
-def update_weights(current_weights: dict, match_details: dict) -> dict:
+def match_details(baseline: dict, observed: dict, weights: dict, matches: dict) -> dict:
+    """Per-feature breakdown for drift reporting; only built for drifted devices."""
+    return {
+        key: {
+            "match": matches[key],
+            "weight": weights.get(key, WEIGHT_INITIAL),
+            "baseline": baseline.get(key),
+            "observed": observed.get(key),
+        }
+        for key in FEATURE_KEYS
+    }
+
+
+def update_weights(current_weights: dict, matches: dict) -> dict:
     """Adjust feature weights based on match results."""
     new_weights = dict(current_weights)
     
     for key in FEATURE_KEYS:
-        detail = match_details.get(key, {})
-        match = detail.get("match", 0.5)
+        match = matches.get(key, 0.5)
         w = new_weights.get(key, WEIGHT_INITIAL)
         
         if match >= 1.0:
@@ -161,6 +252,14 @@ def update_weights(current_weights: dict, match_details: dict) -> dict:
     return new_weights
 
 
+def weights_saturated(weights_json: str | None) -> bool:
+    """True when every feature weight is at WEIGHT_MAX, however the JSON is formatted."""
+    if not weights_json:
+        return False
+    weights = _loads(weights_json)
+    return all(weights.get(k) == WEIGHT_MAX for k in FEATURE_KEYS)
+
+
 def migrate_old_fingerprints(con: sqlite3.Connection):
     """Migrate old schema fingerprints to new schema."""
     # Check if old columns exist
@@ -187,33 +286,31 @@ def migrate_old_fingerprints(con: sqlite3.Connection):
     # Drop and recreate
     con.execute("DROP TABLE IF EXISTS device_fingerprints")
     con.commit()
-    dbm.init_db(con)
+    # init_db() is a no-op once user_version is current; recreate explicitly.
+    con.executescript(dbm.SCHEMA_SQL)
     
     # Migrate old fingerprints as established baselines
+    init_weights_json = _dumps({k: WEIGHT_INITIAL for k in FEATURE_KEYS})
+    rows = []
     for row in old_data:
-        mac = row["device_mac"]
-        label = row["label"]
         fp_hash = row["fingerprint_hash"]
         features = row["features_json"]
         packets = row["packets_total"]
         updated = row["updated_at"]
-        
-        con.execute("""
-            INSERT INTO device_fingerprints 
-            (device_mac, label, baseline_hash, baseline_features_json, baseline_established_at,
-             baseline_packets, last_observed_hash, last_observed_features_json, last_observed_at,
-             last_packets_total, observations_count, match_count, drift_count, confidence,
-             feature_weights_json, data_bytes, first_seen, last_seen, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            mac, label, fp_hash, features, updated, packets,
+        rows.append((
+            row["device_mac"], row["label"], fp_hash, features, updated, packets,
             fp_hash, features, updated, packets,
             1, 1, 0, CONFIDENCE_INITIAL,
-            json.dumps({k: WEIGHT_INITIAL for k in FEATURE_KEYS}),
+            init_weights_json,
             row["data_bytes"], row["first_seen"], row["last_seen"], updated
         ))
-    
-    con.commit()
+
+    with con:
+        con.executemany(BASELINE_INSERT_SQL, rows)
+    # Fresh planner stats after the bulk reload; device_mac is the PRIMARY KEY,
+    # so lookups already seek on its implicit unique index.
+    con.execute("ANALYZE device_fingerprints")
+
     print(f"[fingerprint] Migrated {len(old_data)} existing fingerprints")
 
 
@@ -241,20 +338,25 @@ def main():
     for mac, rec in devices.items():
         if not isinstance(rec, dict):
             continue
-        allowed = rec.get("allowed_ssids") if isinstance(rec.get("allowed_ssids"), list) else []
-        if TARGET_SSID in [str(x) for x in allowed]:
+        allowed = rec.get("allowed_ssids")
+        if not isinstance(allowed, list):
+            continue
+        allowed = [str(x) for x in allowed]
+        if TARGET_SSID in allowed:
             targets[lower_mac(mac)] = {
                 "label": str(rec.get("label") or ""),
-                "allowed_ssids": [str(x) for x in allowed],
+                "allowed_ssids": allowed,
             }
 
     con = dbm.connect(db_path)
     dbm.init_db(con)
     migrate_old_fingerprints(con)
 
-    # Pull the 802.11 view once and filter locally
+    # Ask Kismet for just the target MACs; fall back to pulling the whole 802.11
+    # view and filtering locally if this Kismet lacks the multimac endpoint.
     fields = [
         "kismet.device.base.macaddr",
+        "kismet.device.base.phyname",
         "kismet.device.base.type",
         "kismet.device.base.first_time",
         "kismet.device.base.last_time",
@@ -268,11 +370,17 @@ def main():
         "dot11.device/dot11.device.last_bssid",
     ]
 
-    payload = {"start": 0, "length": 5000, "datatable": False, "fields": fields}
-    items = post_json("/devices/views/phy-IEEE802.11/devices.json", payload)
+    items = []
+    if targets:
+        try:
+            items = post_json("/devices/multimac/devices.json", {"devices": list(targets), "fields": fields})
+        except HTTPError:
+            payload = {"start": 0, "length": 5000, "datatable": False, "fields": fields}
+            items = post_json("/devices/views/phy-IEEE802.11/devices.json", payload)
     if not isinstance(items, list):
         items = items.get("data") if isinstance(items, dict) else []
 
+    # Only target devices are looked up below; skip indexing the rest of the view.
     by_mac = {}
     for it in items:
         if not isinstance(it, dict):
@@ -280,17 +388,36 @@ def main():
         mac = it.get("kismet.device.base.macaddr")
         if not mac:
             continue
-        by_mac[lower_mac(mac)] = it
+        mac = lower_mac(mac)
+        # multimac matches every phy; only 802.11 records carry these features
+        if mac in targets and it.get("kismet.device.base.phyname", "IEEE802.11") == "IEEE802.11":
+            by_mac[mac] = it
 
     # Results tracking
     established = []  # New baselines
     verified = []     # Matched existing baseline
     drifted = []      # Diverged from baseline
     insufficient = []
-
-    # Reset per-device status table each run
-    con.execute("DELETE FROM fingerprint_device_status")
-    con.commit()
+    # Rows are collected here and written in a single transaction after the loop
+    status_rows = []
+    baseline_inserts = []
+    baseline_updates = []
+    observation_updates = []
+    counter_updates = []
+
+    # One timestamp for the whole run
+    now = now_iso()
+    init_weights_json = _dumps({k: WEIGHT_INITIAL for k in FEATURE_KEYS})
+
+    # Existing fingerprints for all targets, fetched up front instead of per device
+    existing = {}
+    macs = list(targets)
+    for i in range(0, len(macs), 500):  # stay under sqlite's bound-parameter limit
+        chunk = macs[i:i + 500]
+        for r in con.execute(
+            f"SELECT * FROM device_fingerprints WHERE device_mac IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            existing[r["device_mac"]] = r
 
     for mac, meta in targets.items():
         label = meta.get("label") or ""
@@ -299,62 +426,50 @@ def main():
         if not it:
             reason = "not in current Kismet view"
             insufficient.append((mac, label, reason))
-            con.execute(
-                """INSERT OR REPLACE INTO fingerprint_device_status
-                   (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (mac, label, "insufficient", reason, None, None, now_iso())
+            status_rows.append(
+                (mac, label, "insufficient", reason, None, None, now)
             )
             continue
 
-        packets_total = int(it.get("kismet.device.base.packets.total") or 0)
-        data_bytes = int(it.get("kismet.device.base.datasize") or 0)
-        first_seen = int(it.get("kismet.device.base.first_time") or 0)
-        last_seen = int(it.get("kismet.device.base.last_time") or 0)
+        # maybe_int tolerates float/string values that would make int() raise
+        packets_total = maybe_int(it.get("kismet.device.base.packets.total")) or 0
+        data_bytes = maybe_int(it.get("kismet.device.base.datasize")) or 0
+        first_seen = maybe_int(it.get("kismet.device.base.first_time")) or 0
+        last_seen = maybe_int(it.get("kismet.device.base.last_time")) or 0
         
         features = extract_features(it)
-        obs_hash = compute_hash(features)
+        features_blob = _dumps_sorted(features)
+        features_json = features_blob.decode("utf-8")
         
         # Check existing fingerprint
-        row = con.execute(
-            "SELECT * FROM device_fingerprints WHERE device_mac = ?", (mac,)
-        ).fetchone()
-        
-        now = now_iso()
+        row = existing.get(mac)
+
+        # Most devices are unchanged between runs; the hash covers exactly the
+        # stored canonical JSON, so an identical string means an identical hash.
+        if row is not None and row["last_observed_hash"] and row["last_observed_features_json"] == features_json:
+            obs_hash = row["last_observed_hash"]
+        else:
+            obs_hash = _hash_blob(features_blob)
         
         if row is None:
             # No existing record
             if packets_total < args.min_packets and not (features.get("probe_fp") or features.get("response_fp")):
                 reason = f"low packets_total={packets_total}"
                 insufficient.append((mac, label, reason))
-                con.execute(
-                    """INSERT OR REPLACE INTO fingerprint_device_status
-                       (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                status_rows.append(
                     (mac, label, "insufficient", reason, packets_total, None, now)
                 )
                 continue
             
             # Establish new baseline
-            init_weights = {k: WEIGHT_INITIAL for k in FEATURE_KEYS}
-            con.execute("""
-                INSERT INTO device_fingerprints
-                (device_mac, label, baseline_hash, baseline_features_json, baseline_established_at,
-                 baseline_packets, last_observed_hash, last_observed_features_json, last_observed_at,
-                 last_packets_total, observations_count, match_count, drift_count, confidence,
-                 feature_weights_json, data_bytes, first_seen, last_seen, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                mac, label, obs_hash, json.dumps(features), now, packets_total,
-                obs_hash, json.dumps(features), now, packets_total,
+            baseline_inserts.append((
+                mac, label, obs_hash, features_json, now, packets_total,
+                obs_hash, features_json, now, packets_total,
                 1, 1, 0, CONFIDENCE_INITIAL,
-                json.dumps(init_weights),
+                init_weights_json,
                 data_bytes, first_seen, last_seen, now
             ))
-            con.execute(
-                """INSERT OR REPLACE INTO fingerprint_device_status
-                   (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            status_rows.append(
                 (mac, label, "established", "baseline created", packets_total, obs_hash, now)
             )
             established.append((mac, label, obs_hash, packets_total, CONFIDENCE_INITIAL))
@@ -364,40 +479,45 @@ def main():
             if packets_total < args.min_packets and not (features.get("probe_fp") or features.get("response_fp")):
                 reason = f"low packets_total={packets_total}"
                 insufficient.append((mac, label, reason))
-                con.execute(
-                    """INSERT OR REPLACE INTO fingerprint_device_status
-                       (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                status_rows.append(
                     (mac, label, "insufficient", reason, packets_total, None, now)
                 )
                 continue
             
-            init_weights = {k: WEIGHT_INITIAL for k in FEATURE_KEYS}
-            con.execute("""
-                UPDATE device_fingerprints SET
-                    baseline_hash = ?, baseline_features_json = ?, baseline_established_at = ?,
-                    baseline_packets = ?, last_observed_hash = ?, last_observed_features_json = ?,
-                    last_observed_at = ?, last_packets_total = ?, observations_count = 1,
-                    match_count = 1, drift_count = 0, confidence = ?,
-                    feature_weights_json = ?, updated_at = ?
-                WHERE device_mac = ?
-            """, (
-                obs_hash, json.dumps(features), now, packets_total,
-                obs_hash, json.dumps(features), now, packets_total,
-                CONFIDENCE_INITIAL, json.dumps(init_weights), now, mac
+            baseline_updates.append((
+                obs_hash, features_json, now, packets_total,
+                obs_hash, features_json, now, packets_total,
+                CONFIDENCE_INITIAL, init_weights_json, now, mac
             ))
-            con.execute(
-                """INSERT OR REPLACE INTO fingerprint_device_status
-                   (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            status_rows.append(
                 (mac, label, "established", "baseline created", packets_total, obs_hash, now)
             )
             established.append((mac, label, obs_hash, packets_total, CONFIDENCE_INITIAL))
-            
+
+        elif (obs_hash == row["baseline_hash"] == row["last_observed_hash"]
+              and weights_saturated(row["feature_weights_json"])):
+            # Unchanged since baseline with every weight already at WEIGHT_MAX:
+            # compare_features would score 1.0 and update_weights would be a
+            # no-op, so only the counters move.
+            match_count = (row["match_count"] or 0) + 1
+            confidence = min(CONFIDENCE_MAX, (row["confidence"] or CONFIDENCE_INITIAL) + CONFIDENCE_MATCH_BOOST)
+            counter_updates.append((
+                now, packets_total, (row["observations_count"] or 0) + 1,
+                match_count, round(confidence, 3), last_seen, now, mac
+            ))
+            status_rows.append(
+                (mac, label, "verified", f"sim=1.00 conf={confidence:.2f}", packets_total, obs_hash, now)
+            )
+            verified.append((mac, label, obs_hash, row["baseline_hash"], 1.0, confidence))
+
         else:
             # Baseline exists - compare and refine
-            baseline_features = json.loads(row["baseline_features_json"])
-            current_weights = json.loads(row["feature_weights_json"] or "{}")
+            if row["baseline_features_json"] == features_json:
+                # Same canonical JSON as this observation; no need to parse it back
+                baseline_features = features
+            else:
+                baseline_features = _loads(row["baseline_features_json"])
+            current_weights = _loads(row["feature_weights_json"] or "{}")
             for k in FEATURE_KEYS:
                 current_weights.setdefault(k, WEIGHT_INITIAL)
             
@@ -406,8 +526,8 @@ def main():
             drift_count = row["drift_count"] or 0
             confidence = row["confidence"] or CONFIDENCE_INITIAL
             
-            similarity, match_details = compare_features(baseline_features, features, current_weights)
-            new_weights = update_weights(current_weights, match_details)
+            similarity, matches = compare_features(baseline_features, features, current_weights)
+            new_weights = update_weights(current_weights, matches)
             
             if similarity >= args.similarity_threshold:
                 # Match - boost confidence
@@ -420,35 +540,34 @@ def main():
                 drift_count += 1
                 confidence = max(CONFIDENCE_MIN, confidence - CONFIDENCE_DRIFT_PENALTY)
                 status = "drift"
-                drifted.append((mac, label, obs_hash, row["baseline_hash"], similarity, confidence, match_details))
+                details = match_details(baseline_features, features, current_weights, matches)
+                drifted.append((mac, label, obs_hash, row["baseline_hash"], similarity, confidence, details))
             
-            con.execute("""
-                UPDATE device_fingerprints SET
-                    last_observed_hash = ?, last_observed_features_json = ?, last_observed_at = ?,
-                    last_packets_total = ?, observations_count = ?, match_count = ?, drift_count = ?,
-                    confidence = ?, feature_weights_json = ?, last_seen = ?, updated_at = ?
-                WHERE device_mac = ?
-            """, (
-                obs_hash, json.dumps(features), now, packets_total,
+            observation_updates.append((
+                obs_hash, features_json, now, packets_total,
                 obs_count, match_count, drift_count, round(confidence, 3),
-                json.dumps(new_weights), last_seen, now, mac
+                _dumps(new_weights), last_seen, now, mac
             ))
-            con.execute(
-                """INSERT OR REPLACE INTO fingerprint_device_status
-                   (device_mac, label, status, reason, packets_total, fingerprint_hash, updated_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            status_rows.append(
                 (mac, label, status, f"sim={similarity:.2f} conf={confidence:.2f}", packets_total, obs_hash, now)
             )
-    
-    con.commit()
 
-    # Record run summary
-    con.execute(
-        """INSERT INTO fingerprint_runs(ts, updated_at, stored, insufficient, min_packets)
-           VALUES (?, ?, ?, ?, ?)""",
-        (int(time.time()), now_iso(), len(established) + len(verified), len(insufficient), args.min_packets)
-    )
-    con.commit()
+    # One transaction for the whole run: status reset, fingerprint updates and
+    # the run summary land together or not at all.
+    with con:
+        cur = con.cursor()
+        cur.execute("DELETE FROM fingerprint_device_status")
+        cur.executemany(BASELINE_INSERT_SQL, baseline_inserts)
+        cur.executemany(BASELINE_UPDATE_SQL, baseline_updates)
+        cur.executemany(OBSERVATION_UPDATE_SQL, observation_updates)
+        cur.executemany(COUNTER_UPDATE_SQL, counter_updates)
+        cur.executemany(STATUS_SQL, status_rows)
+        cur.execute(
+            RUN_INSERT_SQL,
+            (int(time.time()), now, len(established) + len(verified), len(insufficient), args.min_packets)
+        )
+        cur.close()
+    dbm.close(con)
 
     # Output summary
     print(f"=== Fingerprint Summary ===")
@@ -36,6 +36,7 @@ OUI_DB="$ROOT_DIR/assets/data/oui.json"
 
 python3 - "$DAY" "$DB_PATH" "$WATCHLIST" "$WWW_DIR/index.html" "$WWW_DIR/status.json" "$OUI_DB" <<'PY'
 import json, os, sys, time, sqlite3, html
+from concurrent.futures import ThreadPoolExecutor
 
 DAY, DB_PATH, WATCHLIST, OUT_HTML, OUT_STATUS, OUI_DB_PATH = sys.argv[1:7]
 
@@ -107,8 +108,6 @@ def fetch_adguard_known_macs() -> set:
         print(f"[homesigsec] WARN: could not fetch AdGuard clients: {e}")
         return set()
 
-adguard_known_macs = fetch_adguard_known_macs()
-
 def fetch_unifi_clients() -> tuple:
     """Fetch device MACs from UniFi Controller.
     
@@ -201,7 +200,13 @@ def fetch_unifi_clients() -> tuple:
         print(f"[homesigsec] WARN: could not fetch UniFi clients: {e}")
         return set(), set()
 
-unifi_known_macs, unifi_runtime_macs = fetch_unifi_clients()
+# AdGuard and UniFi are independent network round-trips (UniFi alone is a TLS
+# login plus two dumps); run them side by side instead of back to back.
+with ThreadPoolExecutor(max_workers=2) as _pool:
+    _adguard_fut = _pool.submit(fetch_adguard_known_macs)
+    _unifi_fut = _pool.submit(fetch_unifi_clients)
+    adguard_known_macs = _adguard_fut.result()
+    unifi_known_macs, unifi_runtime_macs = _unifi_fut.result()
 
 # Combined authoritative known MACs (devices seen by UniFi OR AdGuard)
 authoritative_known_macs = adguard_known_macs | unifi_known_macs
@@ -412,15 +417,31 @@ with open(OUT_STATUS, 'w', encoding='utf-8') as f:
     f.write('\n')
 
 # Load persisted feedback for drafting and hiding dismissed.
+# The dashboard API stores feedback in sqlite; feedback.json is the legacy store.
 FEEDBACK_PATH = os.path.join(os.path.dirname(WATCHLIST), 'feedback.json')
 feedback_days = {}
 try:
-    with open(FEEDBACK_PATH, 'r', encoding='utf-8') as f:
-        fb = json.load(f)
-        if isinstance(fb, dict):
-            feedback_days = fb.get('days') if isinstance(fb.get('days'), dict) else {}
+    if os.path.exists(DB_PATH):
+        con_fb = sqlite3.connect(DB_PATH)
+        con_fb.row_factory = sqlite3.Row
+        for r in con_fb.execute('SELECT day, alert_id, verdict, note, dismissed, updated_at FROM feedback'):
+            feedback_days.setdefault(r['day'], {})[r['alert_id']] = {
+                'updated_at': r['updated_at'],
+                'verdict': r['verdict'],
+                'note': r['note'],
+                'dismissed': bool(r['dismissed']),
+            }
+        con_fb.close()
 except Exception:
     feedback_days = {}
+if not feedback_days:
+    try:
+        with open(FEEDBACK_PATH, 'r', encoding='utf-8') as f:
+            fb = json.load(f)
+            if isinstance(fb, dict):
+                feedback_days = fb.get('days') if isinstance(fb.get('days'), dict) else {}
+    except Exception:
+        feedback_days = {}
 
 def latest_feedback(alert_id: str):
     """Return (day, rec) for latest feedback for this alert across all days."""
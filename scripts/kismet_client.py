@@ -5,19 +5,69 @@ Auth:
 - Prefer API token in Cookie: KISMET=<token>
 - Else HTTP Basic Auth
 
+Requests reuse one keep-alive HTTP connection per Kismet base URL (and per
+thread), so a run that queries several views pays the TCP (and TLS) handshake
+once. Responses are requested gzip-compressed; large device views shrink
+several-fold on the wire.
+
 No secrets in repo; caller loads env locally.
 """
 
 from __future__ import annotations
 
+import atexit
 import base64
+import functools
+import gzip
+import http.client
 import json
 import os
-from urllib.request import Request, urlopen
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
 # Note: this module is designed to be importable when scripts are executed from this directory.
 
+# http.client connections are not thread-safe; each thread keeps its own.
+# _all_conns tracks every open one (pool threads included) for close_connections().
+_local = threading.local()
+_all_conns: set[http.client.HTTPConnection] = set()
+_all_conns_lock = threading.Lock()
+
+
+def _thread_conns() -> dict[tuple[str, str], http.client.HTTPConnection]:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    return conns
+
+
+def _drop_conn(key: tuple[str, str], conn: http.client.HTTPConnection) -> None:
+    conn.close()
+    _thread_conns().pop(key, None)
+    with _all_conns_lock:
+        _all_conns.discard(conn)
 
+
+def close_connections() -> None:
+    """Close every cached keep-alive connection, whichever thread opened it."""
+    with _all_conns_lock:
+        conns = list(_all_conns)
+        _all_conns.clear()
+    for conn in conns:
+        conn.close()
+
+
+atexit.register(close_connections)
+
+
+# Env is read once per process; call _invalidate_env_cache() after changing it.
+@functools.lru_cache(maxsize=1)
 def _headers_from_env() -> dict[str, str]:
     token = os.environ.get("KISMET_API_TOKEN", "").strip()
     user = os.environ.get("KISMET_USER", "").strip()
@@ -33,6 +83,7 @@ def _headers_from_env() -> dict[str, str]:
     return headers
 
 
+@functools.lru_cache(maxsize=1)
 def kismet_base_url() -> str:
     base = (os.environ.get("KISMET_URL") or "").strip().rstrip("/")
     if not base:
@@ -40,23 +91,81 @@ def kismet_base_url() -> str:
     return base
 
 
-def get_json(path: str, timeout: int = 30):
+@functools.lru_cache(maxsize=1)
+def _split_base_url():
+    return urlsplit(kismet_base_url())
+
+
+def _invalidate_env_cache() -> None:
+    _headers_from_env.cache_clear()
+    kismet_base_url.cache_clear()
+    _split_base_url.cache_clear()
+
+
+def _request(method: str, path: str, body: bytes | None, headers: dict[str, str], timeout: int) -> bytes:
     base = kismet_base_url()
+    u = _split_base_url()
+    key = (u.scheme, u.netloc)
+    _conns = _thread_conns()
+
+    for attempt in (0, 1):
+        conn = _conns.get(key)
+        reused = conn is not None
+        if conn is None:
+            cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+            conn = _conns[key] = cls(u.netloc, timeout=timeout)
+        with _all_conns_lock:
+            # Re-added on every use: a connection closed by close_connections()
+            # reopens lazily on the next request.
+            _all_conns.add(conn)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            conn.request(method, u.path + path, body=body, headers={**headers, "Accept-Encoding": "gzip"})
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.getheader("Content-Encoding", "").lower() == "gzip":
+                data = gzip.decompress(data)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # Kismet closed an idle keep-alive connection; retry once on a fresh one.
+            _drop_conn(key, conn)
+            if reused and attempt == 0:
+                continue
+            raise
+        except Exception:
+            _drop_conn(key, conn)
+            raise
+        if resp.will_close:
+            _drop_conn(key, conn)
+        if resp.status >= 400:
+            raise HTTPError(base + path, resp.status, resp.reason, resp.headers, None)
+        return data
+    raise RuntimeError("unreachable")
+
+
+def _loads(raw: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. invalid UTF-8 in an SSID; decode leniently below
+    return json.loads(raw.decode("utf-8", errors="replace"))
+
+
+def get_json(path: str, timeout: int = 30):
     headers = _headers_from_env()
-    req = Request(base + path, headers=headers, method="GET")
-    raw = urlopen(req, timeout=timeout).read().decode("utf-8", errors="replace")
-    return json.loads(raw)
+    return _loads(_request("GET", path, None, headers, timeout))
 
 
 def post_json(path: str, payload: dict, timeout: int = 60):
-    base = kismet_base_url()
     headers = _headers_from_env()
-    body = json.dumps(payload).encode("utf-8")
-    req = Request(
-        base + path,
-        data=body,
-        headers={**headers, "Content-Type": "application/json"},
-        method="POST",
+    body = orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode("utf-8")
+    raw = _request(
+        "POST",
+        path,
+        body,
+        {**headers, "Content-Type": "application/json"},
+        timeout,
     )
-    raw = urlopen(req, timeout=timeout).read().decode("utf-8", errors="replace")
-    return json.loads(raw)
+    return _loads(raw)
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 """UniFi Controller API client for HomeSigSec."""
 
+import atexit
+import http.cookiejar
 import os
 import json
-import requests
+import ssl
+import time
+import urllib.error
+import urllib.request
 from pathlib import Path
-from typing import Set, Dict, Any
-import urllib3
-
-# Suppress SSL warnings for self-signed certs
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from typing import Set, Dict, Any, Optional, Tuple
 
 def load_credentials() -> Dict[str, str]:
     """Load UniFi credentials from config file."""
@@ -26,8 +27,21 @@ def load_credentials() -> Dict[str, str]:
                 creds[key.strip()] = val.strip().strip('"\'')
     return creds
 
-def get_unifi_known_macs(timeout: int = 15) -> Set[str]:
-    """Get all MACs that have ever connected to UniFi network."""
+# One logged-in session per process, and the last /stat/alluser dump for a short
+# while, so callers asking about several MACs don't log in and re-download each time.
+ALLUSER_TTL_S = 30.0
+
+_session: Optional[urllib.request.OpenerDirector] = None
+_base_url = ""
+_alluser_cache: Optional[Tuple[float, Dict[str, Dict[str, Any]]]] = None
+
+
+def _get_session(timeout: int) -> Tuple[urllib.request.OpenerDirector, str]:
+    """Return the shared logged-in opener (cookie jar), logging in on first use."""
+    global _session, _base_url
+    if _session is not None:
+        return _session, _base_url
+
     creds = load_credentials()
     host = creds.get('UNIFI_HOST', 'unifi.lan:8443')
     user = creds.get('UNIFI_USER', '')
@@ -37,66 +51,83 @@ def get_unifi_known_macs(timeout: int = 15) -> Set[str]:
         raise RuntimeError("UNIFI_USER or UNIFI_PASS not set")
     
     base_url = f"https://{host}"
-    session = requests.Session()
-    session.verify = False
-    
-    # Login
-    login_resp = session.post(
-        f"{base_url}/api/login",
-        json={"username": user, "password": passwd},
-        timeout=timeout
+
+    # Controllers use self-signed certs
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    session = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+        urllib.request.HTTPSHandler(context=ctx),
     )
-    login_resp.raise_for_status()
     
-    # Get all historical clients
-    clients_resp = session.get(
-        f"{base_url}/api/s/default/stat/alluser",
-        timeout=timeout
+    # Login (raises HTTPError on failure)
+    login_req = urllib.request.Request(
+        f"{base_url}/api/login",
+        data=json.dumps({"username": user, "password": passwd}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
     )
-    clients_resp.raise_for_status()
-    
-    data = clients_resp.json()
-    macs = set()
-    for client in data.get('data', []):
-        mac = client.get('mac', '').lower()
-        if mac:
-            macs.add(mac)
-    
-    # Logout
+    with session.open(login_req, timeout=timeout) as resp:
+        resp.read()
+
+    _session, _base_url = session, base_url
+    return session, base_url
+
+
+def close_session() -> None:
+    """Log out and drop the shared session (no-op if never logged in)."""
+    global _session, _alluser_cache
+    session, _session, _alluser_cache = _session, None, None
+    if session is None:
+        return
     try:
-        session.post(f"{base_url}/api/logout", timeout=5)
-    except:
+        req = urllib.request.Request(f"{_base_url}/api/logout", data=b"", method="POST")
+        with session.open(req, timeout=5) as resp:
+            resp.read()
+    except Exception:
         pass
-    
-    return macs
+
+
+atexit.register(close_session)
+
+
+def _get_alluser(timeout: int) -> Dict[str, Dict[str, Any]]:
+    """All historical clients from /stat/alluser keyed by lowercase MAC, cached for ALLUSER_TTL_S."""
+    global _alluser_cache
+    now = time.monotonic()
+    if _alluser_cache is not None and now - _alluser_cache[0] < ALLUSER_TTL_S:
+        return _alluser_cache[1]
+
+    for attempt in (0, 1):
+        session, base_url = _get_session(timeout)
+        try:
+            with session.open(f"{base_url}/api/s/default/stat/alluser", timeout=timeout) as resp:
+                raw = resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 401 and attempt == 0:
+                # Controller expired our login; start a fresh session once.
+                close_session()
+                continue
+            raise
+        break
+
+    by_mac: Dict[str, Dict[str, Any]] = {}
+    for client in json.loads(raw).get('data', []):
+        mac = client.get('mac', '').lower()
+        if mac:
+            by_mac.setdefault(mac, client)  # first entry wins, as the old linear scan did
+    _alluser_cache = (now, by_mac)
+    return by_mac
+
+
+def get_unifi_known_macs(timeout: int = 15) -> Set[str]:
+    """Get all MACs that have ever connected to UniFi network."""
+    return set(_get_alluser(timeout))
 
 def get_unifi_client_details(mac: str, timeout: int = 15) -> Dict[str, Any]:
     """Get details for a specific client MAC."""
-    creds = load_credentials()
-    host = creds.get('UNIFI_HOST', 'unifi.lan:8443')
-    user = creds.get('UNIFI_USER', '')
-    passwd = creds.get('UNIFI_PASS', '')
-    
-    base_url = f"https://{host}"
-    session = requests.Session()
-    session.verify = False
-    
-    # Login
-    session.post(
-        f"{base_url}/api/login",
-        json={"username": user, "password": passwd},
-        timeout=timeout
-    ).raise_for_status()
-    
-    # Get all clients and find the one we want
-    resp = session.get(f"{base_url}/api/s/default/stat/alluser", timeout=timeout)
-    resp.raise_for_status()
-    
-    for client in resp.json().get('data', []):
-        if client.get('mac', '').lower() == mac.lower():
-            return client
-    
-    return {}
+    return _get_alluser(timeout).get(mac.lower(), {})
 
 if __name__ == "__main__":
     import sys
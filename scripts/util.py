@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""HomeSigSec helpers shared by the host scripts (stdlib only)."""
+
+from __future__ import annotations
+
+
+def maybe_int(x):
+    # Hot path: Kismet numeric fields are almost always plain ints already.
+    t = type(x)
+    if t is int:
+        return x
+    if x is None:
+        return None
+    if t is bool:
+        return int(x)
+    if t is float:
+        try:
+            return int(x)
+        except (ValueError, OverflowError):
+            return None
+    if t is str:
+        s = x.strip()
+        # Plain decimal strings convert directly; only the rest (floats,
+        # exponents, junk) go through float() and its exception path.
+        if s.isdecimal() or (s[:1] == "-" and s[1:].isdecimal()):
+            return int(s)
+        try:
+            return int(float(s))
+        except (ValueError, OverflowError):
+            return None
+    return None
@@ -0,0 +1,56 @@
+"""Legacy feedback.json import in the dashboard API."""
+
+from __future__ import annotations
+
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "dashboard-api")
+
+
+class LegacyFeedbackImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "state"))
+        self._env = os.environ.get("HOMESIGSEC_WORKDIR")
+        os.environ["HOMESIGSEC_WORKDIR"] = self.tmp.name
+        sys.path.insert(0, APP_DIR)
+
+    def tearDown(self):
+        sys.path.remove(APP_DIR)
+        sys.modules.pop("app", None)
+        if self._env is None:
+            os.environ.pop("HOMESIGSEC_WORKDIR", None)
+        else:
+            os.environ["HOMESIGSEC_WORKDIR"] = self._env
+        self.tmp.cleanup()
+
+    def test_non_scalar_fields_do_not_block_startup(self):
+        legacy = {
+            "days": {
+                "2026-10-01": {
+                    "rogue_ap:x": {"verdict": {"x": 1}, "note": ["n"], "dismissed": True, "updated_at": 5},
+                    "rogue_ap:y": {"verdict": "benign", "note": "ok"},
+                }
+            }
+        }
+        with open(os.path.join(self.tmp.name, "state", "feedback.json"), "w") as f:
+            json.dump(legacy, f)
+
+        sys.modules.pop("app", None)
+        app = importlib.import_module("app")  # init_feedback() runs on import
+
+        got = app.app.test_client().get("/feedback?day=2026-10-01").get_json()["feedback"]
+        self.assertEqual(got["rogue_ap:x"]["verdict"], "{'x': 1}")
+        self.assertEqual(got["rogue_ap:x"]["note"], "['n']")
+        self.assertEqual(got["rogue_ap:x"]["updated_at"], "5")
+        self.assertTrue(got["rogue_ap:x"]["dismissed"])
+        self.assertEqual(got["rogue_ap:y"]["verdict"], "benign")
+
+
+if __name__ == "__main__":
+    unittest.main()
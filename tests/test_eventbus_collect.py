@@ -0,0 +1,66 @@
+"""Batch persistence in the eventbus collector."""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+COLLECTOR_DIR = os.path.join(os.path.dirname(__file__), "..", "assets", "collector")
+
+
+class PersistBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._env = os.environ.get("HOMESIGSEC_WORKDIR")
+        os.environ["HOMESIGSEC_WORKDIR"] = self.tmp.name
+        sys.path.insert(0, COLLECTOR_DIR)
+        for name in ("db", "eventbus_collect"):
+            sys.modules.pop(name, None)
+        self.ec = importlib.import_module("eventbus_collect")
+        os.makedirs(os.path.dirname(self.ec.db_path()))
+        self.con = self.ec.dbm.connect(self.ec.db_path())
+        self.ec.dbm.init_db(self.con)
+
+    def tearDown(self):
+        self.ec.close_raw()
+        self.con.close()
+        sys.path.remove(COLLECTOR_DIR)
+        for name in ("db", "eventbus_collect"):
+            sys.modules.pop(name, None)
+        if self._env is None:
+            os.environ.pop("HOMESIGSEC_WORKDIR", None)
+        else:
+            os.environ["HOMESIGSEC_WORKDIR"] = self._env
+        self.tmp.cleanup()
+
+    def test_non_object_frames_do_not_drop_the_batch(self):
+        frames = [
+            (1000, json.dumps({"DOT11_PROBED_SSID": {}, "mac": "AA:BB:CC:DD:EE:FF"})),
+            (1001, "[1, 2]"),
+            (1002, '"text"'),
+            (1003, "42"),
+            (1004, "not json"),
+            (1005, json.dumps({"ALERT": {"x": 1}})),
+        ]
+        self.ec.persist_batch(self.con, frames)
+
+        rows = self.con.execute("SELECT ts, topic, mac FROM eventbus_events ORDER BY ts").fetchall()
+        self.assertEqual(
+            [tuple(r) for r in rows],
+            [(1000, "DOT11_PROBED_SSID", "aa:bb:cc:dd:ee:ff"), (1005, "ALERT", "")],
+        )
+
+        self.ec.close_raw()
+        (path,) = glob.glob(os.path.join(self.tmp.name, "raw-eventbus", "*", "*.json.gz"))
+        with gzip.open(path) as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()